@@ -1,9 +1,8 @@
 # providers/arch.py
 import subprocess
-import shutil
 import re
 from pathlib import Path
-from .base_provider import BaseProvider
+from .base_provider import BaseProvider, _which
 
 YELLOW = '\033[1;33m'
 NC = '\033[0m'
@@ -27,16 +26,17 @@ class Provider(BaseProvider):
     """Arch Linux provider implementation."""
 
     def __init__(self):
+        super().__init__()
         self.helper_cmd = None
-        if shutil.which("paru"):
+        if _which("paru"):
             self.helper_cmd = "paru"
-        elif shutil.which("yay"):
+        elif _which("yay"):
             self.helper_cmd = "yay"
         else:
             print(f"{YELLOW}Warning: No AUR helper (paru, yay) found. 'arch_aur' packages will be skipped.{NC}")
         
         # Check for vercmp
-        if not shutil.which("vercmp"):
+        if not _which("vercmp"):
              print(f"{RED}Error: 'vercmp' (from pacman-contrib) is required for version comparison.{NC}")
              print("Please install 'pacman-contrib'")
              # This is a critical error, but we'll let it fail later
@@ -70,10 +70,13 @@ class Provider(BaseProvider):
             if not run_cmd([self.helper_cmd, "-S", "--noconfirm", "--needed"] + aur_pkgs):
                 all_ok = False
 
+        self._invalidate_installed_cache()
         return all_ok
 
     def remove(self, packages: list) -> bool:
-        return run_cmd(["sudo", "pacman", "-Rs", "--noconfirm"] + packages)
+        all_ok = run_cmd(["sudo", "pacman", "-Rs", "--noconfirm"] + packages)
+        self._invalidate_installed_cache()
+        return all_ok
 
     def update(self, ignore_list: list) -> bool:
         if not self.helper_cmd:
@@ -85,8 +88,10 @@ class Provider(BaseProvider):
             print(f"{YELLOW}Ignoring {len(ignore_list)} packages: {', '.join(ignore_list)}{NC}")
             for pkg in ignore_list:
                 cmd.extend(["--ignore", pkg])
-        
-        return run_cmd(cmd)
+
+        all_ok = run_cmd(cmd)
+        self._invalidate_installed_cache()
+        return all_ok
 
     def search(self, package: str) -> bool:
         if self.helper_cmd:
@@ -94,10 +99,13 @@ class Provider(BaseProvider):
         else:
             return run_cmd(["pacman", "-Ss", package])
 
-    def get_installed_packages(self) -> set:
+    def get_installed_packages(self, refresh: bool = False) -> set:
+        if self._installed_cache is not None and not refresh:
+            return self._installed_cache
         try:
             result = run_cmd_capture(["pacman", "-Qq"])
-            return set(result.stdout.strip().split('\n'))
+            self._installed_cache = set(result.stdout.strip().split('\n'))
+            return self._installed_cache
         except (subprocess.CalledProcessError, FileNotFoundError):
             return set()
 
@@ -110,7 +118,9 @@ class Provider(BaseProvider):
         except (subprocess.CalledProcessError, FileNotFoundError, IndexError):
             return ""
             
-    def get_installed_packages_with_versions(self) -> dict:
+    def get_installed_packages_with_versions(self, refresh: bool = False) -> dict:
+        if self._installed_versions_cache is not None and not refresh:
+            return self._installed_versions_cache
         pkg_map = {}
         try:
             result = run_cmd_capture(["pacman", "-Q"])
@@ -121,6 +131,7 @@ class Provider(BaseProvider):
                         pkg_map[name] = version
                     except ValueError:
                         pass # Ignore malformed lines
+            self._installed_versions_cache = pkg_map
             return pkg_map
         except (subprocess.CalledProcessError, FileNotFoundError):
             return pkg_map
@@ -167,7 +178,9 @@ class Provider(BaseProvider):
             return False
         
         # Use pacman -U to install the specific file
-        return run_cmd(["sudo", "pacman", "-U", "--noconfirm", pkg_file])
+        all_ok = run_cmd(["sudo", "pacman", "-U", "--noconfirm", pkg_file])
+        self._invalidate_installed_cache()
+        return all_ok
 
     def show_package_versions(self, package: str):
         # 2. Repo version
@@ -235,4 +248,5 @@ class Provider(BaseProvider):
             if not run_cmd([self.helper_cmd, "-S", "--noconfirm", "--needed", pkg]):
                 print(f"{YELLOW}Warning: Failed to install {pkg}{NC}")
                 all_ok = False
+        self._invalidate_installed_cache()
         return all_ok
@@ -1,13 +1,165 @@
 # providers/base_provider.py
 from abc import ABC, abstractmethod
+import concurrent.futures
+import configparser
+import functools
+import glob
+import json
+import os
 import subprocess
 import shutil
+import tempfile
 
 # --- Add colors for warnings ---
 YELLOW = '\033[1;33m'
 RED = '\033[0;31m'
 NC = '\033[0m'
 
+@functools.lru_cache(maxsize=None)
+def _which(name: str):
+    """Memoized shutil.which(): each probe walks and stats every $PATH entry."""
+    return shutil.which(name)
+
+# --- Pure-Python RPM version comparison (rpmvercmp semantics) ---
+# Shelling out to rpmdev-vercmp / rpm per comparison costs a fork each;
+# sync flows compare thousands of versions, so rpm-based providers share
+# this port of rpm's rpmvercmp.c instead.
+
+def _rpm_vercmp_part(a: str, b: str) -> int:
+    """Compares one EVR component (version or release) like rpm's rpmvercmp()."""
+    if a == b:
+        return 0
+    ia, ib = 0, 0
+    la, lb = len(a), len(b)
+    while ia < la or ib < lb:
+        # Skip separators (anything that is not alphanumeric or '~').
+        while ia < la and not (a[ia].isalnum() or a[ia] == '~'):
+            ia += 1
+        while ib < lb and not (b[ib].isalnum() or b[ib] == '~'):
+            ib += 1
+        # '~' sorts before everything, including the end of the string.
+        tilde_a = ia < la and a[ia] == '~'
+        tilde_b = ib < lb and b[ib] == '~'
+        if tilde_a or tilde_b:
+            if not tilde_a:
+                return 1
+            if not tilde_b:
+                return -1
+            ia += 1
+            ib += 1
+            continue
+        if ia >= la or ib >= lb:
+            break
+        start_a, start_b = ia, ib
+        if a[ia].isdigit():
+            while ia < la and a[ia].isdigit(): ia += 1
+            while ib < lb and b[ib].isdigit(): ib += 1
+            is_num = True
+        else:
+            while ia < la and a[ia].isalpha(): ia += 1
+            while ib < lb and b[ib].isalpha(): ib += 1
+            is_num = False
+        seg_a = a[start_a:ia]
+        seg_b = b[start_b:ib]
+        if not seg_b:
+            # Segments are of different types; numeric is considered newer.
+            return 1 if is_num else -1
+        if is_num:
+            seg_a = seg_a.lstrip('0')
+            seg_b = seg_b.lstrip('0')
+            if len(seg_a) != len(seg_b):
+                return 1 if len(seg_a) > len(seg_b) else -1
+        if seg_a != seg_b:
+            return 1 if seg_a > seg_b else -1
+    if ia >= la and ib >= lb:
+        return 0
+    return 1 if ia < la else -1
+
+def _split_evr(evr: str) -> tuple:
+    """Splits '[epoch:]version[-release]' into (epoch, version, release)."""
+    if ':' in evr:
+        epoch_str, _, rest = evr.partition(':')
+        try:
+            epoch = int(epoch_str)
+        except ValueError:
+            epoch = 0
+    else:
+        epoch, rest = 0, evr
+    version, sep, release = rest.rpartition('-')
+    if not sep:
+        version, release = rest, ""
+    return epoch, version, release
+
+@functools.lru_cache(maxsize=4096)
+def _rpm_compare_evr(evr1: str, evr2: str) -> int:
+    """Compares two full EVR strings. Returns negative, zero or positive."""
+    e1, v1, r1 = _split_evr(evr1)
+    e2, v2, r2 = _split_evr(evr2)
+    if e1 != e2:
+        return 1 if e1 > e2 else -1
+    result = _rpm_vercmp_part(v1, v2)
+    if result:
+        return result
+    return _rpm_vercmp_part(r1, r2)
+
+# --- Disk cache for the installed-package map ---
+# The in-memory cache only helps within one CLI run; between runs the full
+# package-DB parse is redone from scratch. Providers that can derive a cheap
+# staleness key (the DB file's mtime) persist the parsed {name: version}
+# map under ~/.cache/fcli/ and reload it in milliseconds on repeat runs.
+
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "fcli")
+
+def _disk_cache_load(name: str, key: int):
+    """Returns the cached map for (name, key), or None on any miss/error."""
+    try:
+        with open(os.path.join(_CACHE_DIR, f"{name}-{key}.json"), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _disk_cache_store(name: str, key: int, pkg_map: dict):
+    """
+    Atomically writes the map for (name, key) via temp file + os.replace,
+    then unlinks stale entries for the same name (older keys). Best-effort:
+    a read-only or missing cache dir never fails the caller.
+    """
+    try:
+        os.makedirs(_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=_CACHE_DIR, prefix=f".{name}-")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(pkg_map, f)
+        target = os.path.join(_CACHE_DIR, f"{name}-{key}.json")
+        os.replace(tmp_path, target)
+        for stale in glob.glob(os.path.join(_CACHE_DIR, f"{name}-*.json")):
+            if stale != target:
+                try:
+                    os.unlink(stale)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+
+def _flathub_configured():
+    """
+    Checks for the flathub remote by reading flatpak's repo config files
+    directly instead of spawning 'flatpak remotes'. Returns True/False,
+    or None if no config file could be read.
+    """
+    found_config = False
+    for path in ("/var/lib/flatpak/repo/config",
+                 os.path.expanduser("~/.local/share/flatpak/repo/config")):
+        parser = configparser.ConfigParser()
+        try:
+            if not parser.read(path):
+                continue
+        except configparser.Error:
+            continue
+        found_config = True
+        if parser.has_section('remote "flathub"'):
+            return True
+    return False if found_config else None
+
 def _run_cmd_interactive(cmd: list) -> bool:
     """
     Helper to run an interactive command (like flatpak install)
@@ -22,11 +174,32 @@ def _run_cmd_interactive(cmd: list) -> bool:
         print(f"\n{YELLOW}Command cancelled.{NC}")
         return False
 
+def _run_cmd_quiet(cmd: list) -> bool:
+    """Like _run_cmd_interactive, but discards the child's output."""
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return True
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+
 class BaseProvider(ABC):
     """
     Abstract base class defining the interface for all distro providers.
     """
 
+    def __init__(self):
+        # In-memory caches for the installed-package queries. Querying the
+        # package database forks a subprocess and parses its full output, so
+        # providers memoize the result here and drop it via
+        # _invalidate_installed_cache() whenever they mutate the system.
+        self._installed_cache = None
+        self._installed_versions_cache = None
+
+    def _invalidate_installed_cache(self):
+        """Drops the installed-package caches after install/remove/update/downgrade."""
+        self._installed_cache = None
+        self._installed_versions_cache = None
+
     @abstractmethod
     def install(self, packages: list) -> bool:
         """Install a list of packages."""
@@ -48,8 +221,8 @@ class BaseProvider(ABC):
         pass
 
     @abstractmethod
-    def get_installed_packages(self) -> set:
-        """Return a set of all installed package names."""
+    def get_installed_packages(self, refresh: bool = False) -> set:
+        """Return a set of all installed package names (cached; refresh forces a re-query)."""
         pass
 
     @abstractmethod
@@ -70,8 +243,8 @@ class BaseProvider(ABC):
         pass
     
     @abstractmethod
-    def get_installed_packages_with_versions(self) -> dict:
-        """Return a dict of {pkg_name: version} for all installed packages."""
+    def get_installed_packages_with_versions(self, refresh: bool = False) -> dict:
+        """Return a dict of {pkg_name: version} for all installed packages (cached)."""
         pass
     
     @abstractmethod
@@ -88,7 +261,28 @@ class BaseProvider(ABC):
         pass
 
     # --- Optional Helper Methods ---
-    
+
+    @staticmethod
+    def _rpm_compare(v1: str, v2: str) -> int:
+        """
+        Compares two RPM EVR strings in pure Python, following rpmvercmp
+        semantics, in the compare_versions() convention:
+        1 if v1 > v2, 0 if equal, 2 if v1 < v2.
+        """
+        result = _rpm_compare_evr(v1, v2)
+        if result > 0: return 1
+        if result < 0: return 2
+        return 0
+
+    def get_package_versions(self, packages: list) -> dict:
+        """
+        Bulk version lookup: {pkg_name: version or ""} for many packages
+        with a single installed-package query. Callers looping over
+        get_package_version() should prefer this.
+        """
+        installed = self.get_installed_packages_with_versions()
+        return {pkg: installed.get(pkg, "") for pkg in packages}
+
     def _unsupported(self, feature_name: str) -> bool:
         """Default function for unsupported features."""
         print(f"{YELLOW}Warning: {feature_name} packages are declared, but this system's provider ({self.__class__.__name__}) does not support them. Skipping.{NC}")
@@ -106,25 +300,51 @@ class BaseProvider(ABC):
     def install_overlay(self, overlay_map: dict) -> bool: return self._unsupported("Gentoo Overlay")
     def install_src(self, packages: list) -> bool: return self._unsupported("Void Src")
 
-    def install_flatpak(self, packages: list) -> bool:
+    def install_flatpak(self, packages: list, quiet: bool = False) -> bool:
         """
-        Installs a list of Flatpaks.
+        Installs a list of Flatpaks. quiet=True silences the flatpak child
+        processes, for runs on a worker thread whose output would otherwise
+        interleave with the foreground installers.
         """
+        # Probe $PATH directly rather than through the memoized _which():
+        # flatpak may have been installed as a native package earlier in
+        # this very run, after the cache recorded a miss.
         if not shutil.which("flatpak"):
             print(f"{RED}Error: 'flatpak' command not found. Cannot install Flatpaks.{NC}")
             deps = self.get_deps()
             print(f"Please install it first: {deps.get('flatpak', 'sudo <your-package-manager> install flatpak')}")
             return False
-        
+
+        run = _run_cmd_quiet if quiet else _run_cmd_interactive
         try:
-            repo_list = subprocess.run(["flatpak", "remotes", "--columns=name"], capture_output=True, text=True, check=True).stdout
-            if "flathub" not in repo_list:
+            configured = _flathub_configured()
+            if configured is None:
+                # No repo config readable; fall back to asking flatpak itself.
+                repo_list = subprocess.run(["flatpak", "remotes", "--columns=name"], capture_output=True, text=True, check=True).stdout
+                configured = "flathub" in repo_list
+            if not configured:
                 print(f"{YELLOW}Warning: 'flathub' remote not found. Adding it now...{NC}")
-                if not _run_cmd_interactive(["sudo", "flatpak", "remote-add", "--if-not-exists", "flathub", "https://flathub.org/repo/flathub.flatpakrepo"]):
+                if not run(["sudo", "flatpak", "remote-add", "--if-not-exists", "flathub", "https://flathub.org/repo/flathub.flatpakrepo"]):
                     print(f"{RED}Error: Failed to add 'flathub' remote. Cannot install packages.{NC}")
                     return False
         except Exception as e:
             print(f"{RED}Error checking flatpak remotes: {e}{NC}")
             return False
 
-        return _run_cmd_interactive(["sudo", "flatpak", "install", "-y", "--non-interactive", "flathub"] + packages)
+        return run(["sudo", "flatpak", "install", "-y", "--non-interactive", "flathub"] + packages)
+
+    def install_flatpak_async(self, packages: list) -> concurrent.futures.Future:
+        """
+        Runs install_flatpak() on a worker thread and returns a Future, so
+        callers can overlap the flatpak remote setup and install with the
+        native package work and join at the end of the workflow. Callers
+        must ensure the flatpak binary already exists. The worker runs
+        quiet so its output does not interleave with the foreground
+        installers, and sudo credentials are cached up front so the
+        background sudo never races a foreground password prompt.
+        """
+        subprocess.run(["sudo", "-v"])
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.install_flatpak, packages, True)
+        executor.shutdown(wait=False)
+        return future
@@ -1,10 +1,14 @@
 # providers/debian.py
+import concurrent.futures
+import functools
+import glob
 import subprocess
+import sys
+import time
 import os
-import shutil
 import re
 from pathlib import Path
-from .base_provider import BaseProvider
+from .base_provider import BaseProvider, _which, _disk_cache_load, _disk_cache_store
 
 YELLOW = '\033[1;33m'
 RED = '\033[0;31m'
@@ -12,63 +16,241 @@ NC = '\033[0m'
 GREEN = '\033[0;32m'
 BLUE = '\033[0;34m'
 
+# Computed once at import: copying os.environ on every subprocess call adds
+# up over the hundreds of spawns a large install performs.
+_APT_ENV = {**os.environ, "DEBIAN_FRONTEND": "noninteractive"}
+
+# Subprocess spawn cost: CPython can use posix_spawn() instead of
+# fork()+exec(), which matters once this process holds a large installed map
+# (fork copies the page tables). But that path demands more than avoiding
+# preexec_fn/shell=True/cwd/start_new_session: it also requires
+# close_fds=False and a path-qualified executable. The helpers here keep the
+# safe close_fds default and bare command names, so every spawn currently
+# goes through fork+exec — all of the conditions above would have to be met
+# before any call site actually takes the fast path.
+
+def _apt(cmd: list, capture: bool = False, retries: int = 5, backoff: float = 2.0):
+    """
+    Single subprocess helper for all apt/dpkg invocations.
+
+    With capture=False, stdout streams to the user and a bool is returned;
+    with capture=True the CompletedProcess is returned. Either way stderr
+    is inspected so a transient apt/dpkg lock collision (unattended
+    upgrades, another apt in a second terminal) is retried with
+    exponential backoff instead of failing the whole run.
+    """
+    while True:
+        if capture:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  text=True, env=_APT_ENV, errors='ignore')
+        else:
+            try:
+                proc = subprocess.run(cmd, stderr=subprocess.PIPE, text=True, env=_APT_ENV, errors='ignore')
+            except FileNotFoundError:
+                return False
+            except KeyboardInterrupt:
+                print(f"\n{YELLOW}Command cancelled.{NC}")
+                return False
+            if proc.stderr:
+                sys.stderr.write(proc.stderr)
+        stderr = proc.stderr or ""
+        if (proc.returncode != 0 and retries > 0
+                and ("Could not get lock" in stderr or "dpkg frontend lock" in stderr)):
+            print(f"{YELLOW}apt/dpkg lock is held by another process. Retrying in {backoff:.0f}s...{NC}")
+            time.sleep(backoff)
+            backoff *= 2
+            retries -= 1
+            continue
+        if capture:
+            return proc
+        return proc.returncode == 0
+
 def _run_cmd_interactive(cmd: list) -> bool:
     """Helper to run an interactive subprocess command (like apt install)."""
-    try:
-        env = os.environ.copy()
-        env["DEBIAN_FRONTEND"] = "noninteractive"
-        subprocess.run(cmd, check=True, env=env)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
-    except KeyboardInterrupt:
-        print(f"\n{YELLOW}Command cancelled.{NC}")
-        return False
+    return _apt(cmd)
 
 def _run_cmd_capture(cmd: list) -> subprocess.CompletedProcess:
     """Helper to run a non-interactive command and capture output."""
-    env = os.environ.copy()
-    env["DEBIAN_FRONTEND"] = "noninteractive"
-    return subprocess.run(cmd, capture_output=True, text=True, env=env, errors='ignore')
+    return _apt(cmd, capture=True)
+
+
+# \S+ also avoids capturing trailing whitespace or color codes
+_CANDIDATE_RE = re.compile(r"Candidate:\s*(\S+)")
+
+_DPKG_STATUS_FILE = "/var/lib/dpkg/status"
+
+def _parse_dpkg_status(path: str = _DPKG_STATUS_FILE):
+    """
+    Yields (name, version) for installed packages straight from dpkg's
+    status file. dpkg-query parses the very same file, so reading it
+    ourselves skips the fork plus the serialize-to-stdout/reparse
+    round-trip; only the Package:/Status:/Version: fields are examined.
+    """
+    name = version = None
+    installed = False
+    with open(path, 'r', errors='ignore') as f:
+        for line in f:
+            if line.startswith("Package:"):
+                name = line[8:].strip()
+            elif line.startswith("Status:"):
+                installed = "install ok installed" in line
+            elif line.startswith("Version:"):
+                version = line[8:].strip()
+            elif line == '\n':
+                if name and installed and version:
+                    yield name, version
+                name = version = None
+                installed = False
+    if name and installed and version:
+        yield name, version
+
+
+# --- Pure-Python Debian version comparison (see deb-version(5)) ---
+# Forking `dpkg --compare-versions` twice per comparison is O(N) subprocess
+# spawns when sync/pin flows compare thousands of packages. The algorithm
+# below is a direct port of dpkg's verrevcmp(); the subprocess path is kept
+# behind FCLI_STRICT_DPKG as an escape hatch.
+
+def _deb_char_order(c: str) -> int:
+    """Sort weight of one character: '~' < end-of-string < letters < everything else."""
+    if c == '~':
+        return -1
+    if c.isdigit():
+        return 0
+    if c.isalpha():
+        return ord(c)
+    return ord(c) + 256
+
+def _deb_compare_part(a: str, b: str) -> int:
+    """Compares one epoch-free part (upstream version or revision) like dpkg's verrevcmp()."""
+    ia, ib = 0, 0
+    la, lb = len(a), len(b)
+    while ia < la or ib < lb:
+        # Compare the leading non-digit runs character by character.
+        while (ia < la and not a[ia].isdigit()) or (ib < lb and not b[ib].isdigit()):
+            ac = _deb_char_order(a[ia]) if ia < la and not a[ia].isdigit() else 0
+            bc = _deb_char_order(b[ib]) if ib < lb and not b[ib].isdigit() else 0
+            if ac != bc:
+                return ac - bc
+            ia += 1
+            ib += 1
+        # Strip leading zeroes, then compare the digit runs numerically.
+        while ia < la and a[ia] == '0':
+            ia += 1
+        while ib < lb and b[ib] == '0':
+            ib += 1
+        first_diff = 0
+        while ia < la and a[ia].isdigit() and ib < lb and b[ib].isdigit():
+            if first_diff == 0:
+                first_diff = ord(a[ia]) - ord(b[ib])
+            ia += 1
+            ib += 1
+        if ia < la and a[ia].isdigit():
+            return 1  # a's number is longer, so larger
+        if ib < lb and b[ib].isdigit():
+            return -1
+        if first_diff:
+            return first_diff
+    return 0
+
+def _split_deb_version(v: str) -> tuple:
+    """Splits '[epoch:]upstream[-revision]' into (epoch, upstream, revision)."""
+    if ':' in v:
+        epoch_str, _, rest = v.partition(':')
+        try:
+            epoch = int(epoch_str)
+        except ValueError:
+            epoch = 0
+    else:
+        epoch, rest = 0, v
+    upstream, sep, revision = rest.rpartition('-')
+    if not sep:
+        upstream, revision = rest, ""
+    return epoch, upstream, revision
+
+@functools.lru_cache(maxsize=4096)
+def _dpkg_compare(a: str, b: str) -> int:
+    """Pure-Python dpkg version comparison. Returns negative, zero or positive."""
+    if a == b:
+        return 0
+    ea, ua, ra = _split_deb_version(a)
+    eb, ub, rb = _split_deb_version(b)
+    if ea != eb:
+        return 1 if ea > eb else -1
+    result = _deb_compare_part(ua, ub)
+    if result:
+        return result
+    return _deb_compare_part(ra, rb)
 
 
 class Provider(BaseProvider):
     """Debian/Ubuntu provider implementation."""
     
     def __init__(self):
-        if not shutil.which("add-apt-repository"):
-            print(f"{YELLOW}Warning: 'add-apt-repository' not found. PPAs will not work.{NC}")
-            print("Please install 'software-properties-common'.")
-            self.can_add_ppa = False
-        else:
-            self.can_add_ppa = True
-            
-        if not shutil.which("dirmngr"):
-            print(f"{YELLOW}Warning: 'dirmngr' not found. PPA key imports may fail.{NC}")
-            print("Please install 'dirmngr'.")
-            self.can_import_keys = False
-        else:
-            self.can_import_keys = True
-            
-        if not shutil.which("dpkg"):
-            print(f"{RED}Error: 'dpkg' not found. This provider cannot function.{NC}")
-            self.can_compare = False
-        else:
-            self.can_compare = True
+        super().__init__()
+        # Each 'apt update' rebuilds the full cache and hits every repo;
+        # never pay for it twice within one CLI run.
+        self._apt_updated_this_run = False
+
+        # mtime of /var/lib/dpkg/status when the installed map was last
+        # parsed; lets us invalidate the in-memory cache with one stat().
+        self._dpkg_status_mtime = None
+
+    # Capability probes are lazy so e.g. 'search' never pays for $PATH
+    # walks (or prints PPA warnings) it does not need. Warnings are
+    # printed at the call sites that actually require the feature.
+
+    @functools.cached_property
+    def can_add_ppa(self) -> bool:
+        return bool(_which("add-apt-repository"))
+
+    @functools.cached_property
+    def can_import_keys(self) -> bool:
+        return bool(_which("dirmngr"))
+
+    @functools.cached_property
+    def can_compare(self) -> bool:
+        return bool(_which("dpkg"))
+
+    def _apt_update(self) -> bool:
+        """Runs 'apt update' at most once per process."""
+        if self._apt_updated_this_run:
+            print(f"{BLUE}Package lists already refreshed this run. Skipping apt update.{NC}")
+            return True
+        ok = _run_cmd_interactive(["sudo", "apt-get", "update"])
+        if ok:
+            self._apt_updated_this_run = True
+        return ok
 
     def install(self, packages: list) -> bool:
-        """Installs packages one-by-one to show progress."""
+        """Installs all packages in one apt call, falling back to one-by-one on failure."""
+        if not packages:
+            return True
+        print(f"\n--- Installing {len(packages)} packages ---")
+        if _run_cmd_interactive(["sudo", "apt-get", "install", "-y", "--no-install-recommends"] + packages):
+            self._invalidate_installed_cache()
+            return True
+        if len(packages) == 1:
+            print(f"{YELLOW}Warning: Failed to install {packages[0]}{NC}")
+            self._invalidate_installed_cache()
+            return False
+        # The batch failed. Retry one-by-one to identify the culprit
+        # and still install everything else.
+        print(f"{YELLOW}Batch install failed. Retrying packages one-by-one...{NC}")
         all_ok = True
         total = len(packages)
         for i, pkg in enumerate(packages):
             print(f"\n--- Installing {pkg} ({i+1}/{total}) ---")
-            if not _run_cmd_interactive(["sudo", "apt", "install", "-y", pkg]):
+            if not _run_cmd_interactive(["sudo", "apt-get", "install", "-y", "--no-install-recommends", pkg]):
                 print(f"{YELLOW}Warning: Failed to install {pkg}{NC}")
                 all_ok = False
+        self._invalidate_installed_cache()
         return all_ok
 
     def remove(self, packages: list) -> bool:
-        return _run_cmd_interactive(["sudo", "apt", "remove", "-y"] + packages)
+        all_ok = _run_cmd_interactive(["sudo", "apt-get", "remove", "-y"] + packages)
+        self._invalidate_installed_cache()
+        return all_ok
 
     def update(self, ignore_list: list) -> bool:
         """Updates packages, respecting holds."""
@@ -79,55 +261,107 @@ class Provider(BaseProvider):
                 return False
         
         print(f"{BLUE}Running apt update...{NC}")
-        _run_cmd_interactive(["sudo", "apt", "update"])
-        
-        print(f"{BLUE}Running apt upgrade...{NC}")
-        all_ok = _run_cmd_interactive(["sudo", "apt", "upgrade", "-y"])
+        self._apt_update()
+
+        # Probe with a simulated upgrade first: on frequently synced systems
+        # nothing is upgradable most of the time, and the real transaction
+        # would still open the full cache and run triggers. The simulation
+        # runs after the holds above, so it respects them.
+        sim = _run_cmd_capture(["apt-get", "-s", "upgrade"])
+        if sim.returncode == 0 and re.search(r"^0 upgraded, 0 newly installed", sim.stdout, re.MULTILINE):
+            print(f"{GREEN}Nothing to upgrade.{NC}")
+            all_ok = True
+        else:
+            print(f"{BLUE}Running apt upgrade...{NC}")
+            all_ok = _run_cmd_interactive(["sudo", "apt-get", "upgrade", "-y"])
         
         if ignore_list:
             print(f"{YELLOW}Un-holding {len(ignore_list)} packages...{NC}")
             if not _run_cmd_interactive(["sudo", "apt-mark", "unhold"] + ignore_list):
                 print(f"{RED}Error removing package holds.{NC}")
                 all_ok = False
-        
+
+        self._invalidate_installed_cache()
         return all_ok
 
     def search(self, package: str) -> bool:
         return _run_cmd_interactive(["apt", "search", package])
 
-    def get_installed_packages(self) -> set:
-        try:
-            result = _run_cmd_capture(["dpkg-query", "-W", "-f", "${binary:Package}\n"])
-            return set(result.stdout.strip().split('\n'))
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return set()
+    def get_installed_packages(self, refresh: bool = False) -> set:
+        if self._installed_cache is not None and not refresh:
+            return self._installed_cache
+        # Derive the name set from the name+version query so both methods
+        # share a single dpkg-query invocation (and its cache).
+        self._installed_cache = set(self.get_installed_packages_with_versions(refresh=refresh))
+        return self._installed_cache
             
     # --- NEW: Version Pinning Methods ---
     
     def get_package_version(self, package: str) -> str:
+        # Dict lookup against the memoized name->version map; avoids one
+        # dpkg-query fork per package in pin-verification loops.
+        return self.get_installed_packages_with_versions().get(package, "")
+
+    def get_installed_packages_with_versions(self, refresh: bool = False) -> dict:
+        mtime = None
         try:
-            result = _run_cmd_capture(["dpkg-query", "-W", "-f", "${Version}", package])
-            return result.stdout.strip()
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return ""
+            mtime = os.stat(_DPKG_STATUS_FILE).st_mtime_ns
+        except OSError:
+            pass
+        if (self._installed_versions_cache is not None and not refresh
+                and mtime == self._dpkg_status_mtime):
+            return self._installed_versions_cache
 
-    def get_installed_packages_with_versions(self) -> dict:
+        # Disk cache: the parse survives across CLI invocations as long as
+        # the status file's mtime is unchanged.
+        if mtime is not None and not refresh:
+            pkg_map = _disk_cache_load("installed-dpkg", mtime)
+            if pkg_map is not None:
+                self._installed_versions_cache = pkg_map
+                self._dpkg_status_mtime = mtime
+                return pkg_map
+
+        # Primary path: read dpkg's status file directly.
+        if mtime is not None:
+            try:
+                pkg_map = dict(_parse_dpkg_status())
+                self._installed_versions_cache = pkg_map
+                self._dpkg_status_mtime = mtime
+                _disk_cache_store("installed-dpkg", mtime, pkg_map)
+                return pkg_map
+            except OSError:
+                pass
+
+        # Fallback: dpkg-query, if the status file is unreadable.
         pkg_map = {}
         try:
-            result = _run_cmd_capture(["dpkg-query", "-W", "-f", "${binary:Package}\t${Version}\n"])
-            for line in result.stdout.strip().split('\n'):
-                if line and '\t' in line:
-                    try:
-                        name, version = line.split('\t')
+            # Stream line-by-line instead of buffering the full output (which
+            # can run to tens of MB) into one string and splitting it.
+            with subprocess.Popen(["dpkg-query", "-W", "-f", "${binary:Package}\t${Version}\n"],
+                                  stdout=subprocess.PIPE, text=True, errors='ignore',
+                                  env=_APT_ENV, bufsize=1 << 20) as proc:
+                for line in proc.stdout:
+                    name, sep, version = line.rstrip('\n').partition('\t')
+                    if sep:
                         pkg_map[name] = version
-                    except ValueError:
-                        pass
+            self._installed_versions_cache = pkg_map
             return pkg_map
         except (subprocess.CalledProcessError, FileNotFoundError):
             return pkg_map
             
     def compare_versions(self, v1: str, v2: str) -> int:
-        if not self.can_compare: return 0
+        if os.environ.get("FCLI_STRICT_DPKG"):
+            return self._compare_versions_dpkg(v1, v2)
+        result = _dpkg_compare(v1, v2)
+        if result > 0: return 1
+        if result < 0: return 2
+        return 0
+
+    def _compare_versions_dpkg(self, v1: str, v2: str) -> int:
+        """Original dpkg subprocess path, kept behind FCLI_STRICT_DPKG."""
+        if not self.can_compare:
+            print(f"{RED}Error: 'dpkg' not found. Cannot compare versions.{NC}")
+            return 0
         try:
             # dpkg --compare-versions <v1> <op> <v2>
             # Returns 0 for true, 1 for false.
@@ -143,22 +377,36 @@ class Provider(BaseProvider):
         """Downgrades a package to a specific version."""
         print(f"  {BLUE}Attempting to install {package}={version}...{NC}")
         # apt install <pkg=version> is the standard way
-        if not _run_cmd_interactive(["sudo", "apt", "install", "-y", f"{package}={version}"]):
+        if not _run_cmd_interactive(["sudo", "apt-get", "install", "-y", f"{package}={version}"]):
             print(f"  {YELLOW}Could not install {package}={version}. It may not be available in your repos.{NC}")
+            self._invalidate_installed_cache()
             return False
+        self._invalidate_installed_cache()
         return True
 
     def show_package_versions(self, package: str):
-        # 2. Repo version
+        # 2. Repo version. apt-cache has stable script-oriented output and a
+        # cheaper cache-open path than the human-facing 'apt' frontend.
         try:
-            result = _run_cmd_capture(["apt", "policy", package])
+            result = _run_cmd_capture(["apt-cache", "policy", package])
             # Look for "Candidate:"
-            repo_ver = re.search(r"Candidate:\s*(.*)", result.stdout).group(1)
-            print(f"  {BLUE}Available:{NC} {repo_ver.strip()}")
+            repo_ver = _CANDIDATE_RE.search(result.stdout).group(1)
+            print(f"  {BLUE}Available:{NC} {repo_ver}")
         except (subprocess.CalledProcessError, AttributeError):
             print(f"  {YELLOW}Not found in repositories{NC}")
-        # 3. Cached versions (not easily queryable like pacman)
-        print(f"  {BLUE}In Cache:{NC} (Run 'apt-cache policy {package}' for details)")
+        # 3. All versions known to the cache (apt-cache madison: 'pkg | version | source')
+        print(f"  {BLUE}In Cache:{NC}")
+        result = _run_cmd_capture(["apt-cache", "madison", package])
+        versions = []
+        for line in result.stdout.splitlines():
+            parts = line.split('|')
+            if len(parts) >= 2:
+                versions.append(parts[1].strip())
+        if versions:
+            for ver in dict.fromkeys(versions):
+                print(f"    - {ver}")
+        else:
+            print("    (none)")
         
     # --- End of Versioning Methods ---
 
@@ -193,8 +441,11 @@ class Provider(BaseProvider):
         }
 
     def install_ppa(self, ppa_map: dict) -> bool:
+        if not ppa_map:
+            return True
         if not self.can_add_ppa:
             print(f"{RED}Error: 'add-apt-repository' is not available. Cannot add PPAs.{NC}")
+            print("Please install 'software-properties-common'.")
             return False
         
         if not self.can_import_keys:
@@ -205,11 +456,33 @@ class Provider(BaseProvider):
         all_ok = True
         all_packages_to_install = []
         needs_update = False
-        
+
+        def _add_ppa(ppa):
+            return ppa, _run_cmd_capture(["sudo", "add-apt-repository", "-y", ppa])
+
+        # Fast path: a previously added PPA already has its sources file, so
+        # skip the add-apt-repository subprocess (and its network round-trip)
+        # entirely on repeat runs.
+        to_add = []
         for ppa, packages in ppa_map.items():
-            print(f"Checking PPA: {ppa}...")
-            proc = _run_cmd_capture(["sudo", "add-apt-repository", "-y", ppa])
-            
+            match = re.match(r"ppa:([^/]+)/(.+)", ppa)
+            if match and glob.glob(f"/etc/apt/sources.list.d/{match.group(1)}-ubuntu-{match.group(2)}-*.list"):
+                print(f"PPA {ppa} is already enabled.")
+                all_packages_to_install.extend(packages)
+                continue
+            to_add.append(ppa)
+
+        results = []
+        if to_add:
+            # Each add-apt-repository call spends seconds on Launchpad and GPG
+            # key network I/O but writes its own file under
+            # /etc/apt/sources.list.d/, so distinct PPAs can be added in parallel.
+            print(f"Checking {len(to_add)} PPA(s)...")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(to_add))) as pool:
+                results = list(pool.map(_add_ppa, to_add))
+
+        for ppa, proc in results:
+            packages = ppa_map[ppa]
             if proc.returncode != 0:
                 print(f"{RED}Error: Failed to add PPA: {ppa}{NC}")
                 print(f"{YELLOW}STDERR: {proc.stderr}{NC}")
@@ -222,16 +495,19 @@ class Provider(BaseProvider):
                 else:
                     print(f"PPA {ppa} is already enabled.")
 
-        
+
         if needs_update:
             print("Running 'apt update' after adding new PPAs...")
-            if not _run_cmd_interactive(["sudo", "apt", "update"]):
+            # A new sources file means the cached lists are stale, even if an
+            # update already ran earlier this process.
+            self._apt_updated_this_run = False
+            if not self._apt_update():
                 print(f"{RED}Error: 'apt update' failed. Stopping PPA install.{NC}")
                 return False
         
         if all_packages_to_install:
             print(f"Installing packages from PPAs...")
-            # Install one-by-one to give feedback
+            # One batched apt call for everything the PPAs provide
             if not self.install(all_packages_to_install):
                 all_ok = False
                 
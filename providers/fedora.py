@@ -37,10 +37,13 @@ class Provider(BaseProvider):
             if not run_cmd(["sudo", "dnf", "install", "-y", pkg_name]):
                 print(f"{YELLOW}Warning: Failed to install {pkg_name}{NC}")
                 all_ok = False
+        self._invalidate_installed_cache()
         return all_ok
 
     def remove(self, packages: list) -> bool:
-        return run_cmd(["sudo", "dnf", "remove", "-y"] + packages)
+        all_ok = run_cmd(["sudo", "dnf", "remove", "-y"] + packages)
+        self._invalidate_installed_cache()
+        return all_ok
 
     def update(self, ignore_list: list) -> bool:
         cmd = ["sudo", "dnf", "update", "-y"]
@@ -48,15 +51,20 @@ class Provider(BaseProvider):
             print(f"{YELLOW}Ignoring {len(ignore_list)} packages: {', '.join(ignore_list)}{NC}")
             for pkg in ignore_list:
                 cmd.append(f"--exclude={pkg}")
-        return run_cmd(cmd)
+        all_ok = run_cmd(cmd)
+        self._invalidate_installed_cache()
+        return all_ok
 
     def search(self, package: str) -> bool:
         return run_cmd(["dnf", "search", package])
 
-    def get_installed_packages(self) -> set:
+    def get_installed_packages(self, refresh: bool = False) -> set:
+        if self._installed_cache is not None and not refresh:
+            return self._installed_cache
         try:
             result = run_cmd_capture(["rpm", "-qa", "--qf", "%{NAME}\n"])
-            return set(result.stdout.strip().split('\n'))
+            self._installed_cache = set(result.stdout.strip().split('\n'))
+            return self._installed_cache
         except (subprocess.CalledProcessError, FileNotFoundError):
             return set()
 
@@ -70,7 +78,9 @@ class Provider(BaseProvider):
         except (subprocess.CalledProcessError, FileNotFoundError):
             return ""
 
-    def get_installed_packages_with_versions(self) -> dict:
+    def get_installed_packages_with_versions(self, refresh: bool = False) -> dict:
+        if self._installed_versions_cache is not None and not refresh:
+            return self._installed_versions_cache
         pkg_map = {}
         try:
             # rpm -qa --qf '%{NAME}\t%{VERSION}-%{RELEASE}\n'
@@ -82,22 +92,18 @@ class Provider(BaseProvider):
                         pkg_map[name] = version
                     except ValueError:
                         pass
+            self._installed_versions_cache = pkg_map
             return pkg_map
         except (subprocess.CalledProcessError, FileNotFoundError):
             return pkg_map
             
     def compare_versions(self, v1: str, v2: str) -> int:
         try:
-            # Use rpmdev-vercmp if available (from rpmdevtools)
-            proc = subprocess.run(["rpmdev-vercmp", v1, v2], capture_output=True, text=True)
-            if proc.returncode == 11: return 1 # v1 > v2
-            if proc.returncode == 12: return 2 # v1 < v2
-            return 0 # v1 == v2
-        except FileNotFoundError:
-            # Fallback for simple string compare
-            if v1 > v2: return 1
-            if v1 < v2: return 2
-            return 0
+            # Pure-Python rpmvercmp from BaseProvider; avoids forking
+            # rpmdev-vercmp once per comparison.
+            return self._rpm_compare(v1, v2)
+        except Exception:
+            return 0 # Failsafe
             
     def downgrade(self, package: str, version: str) -> bool:
         """Downgrades a package to a specific version."""
@@ -106,7 +112,9 @@ class Provider(BaseProvider):
         if not run_cmd(["sudo", "dnf", "downgrade", "-y", f"{package}-{version}"]):
             print(f"  {YELLOW}Could not downgrade {package}. It may not be available in your repos.{NC}")
             print(f"  {YELLOW}Try running: sudo dnf --showduplicates list {package}{NC}")
+            self._invalidate_installed_cache()
             return False
+        self._invalidate_installed_cache()
         return True
 
     def show_package_versions(self, package: str):
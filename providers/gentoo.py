@@ -1,8 +1,8 @@
 # providers/gentoo.py
+import os
 import subprocess
-import shutil
 import re
-from .base_provider import BaseProvider
+from .base_provider import BaseProvider, _which, _disk_cache_load, _disk_cache_store
 
 YELLOW = '\033[1;33m'
 NC = '\033[0m'
@@ -10,6 +10,46 @@ RED = '\033[0;31m'
 BLUE = '\033[0;34m'
 GREEN = '\033[0;32m'
 
+_PKG_DB_DIR = "/var/db/pkg"
+
+# PF is "<name>-<version>[-r<rev>]"; the version starts at the first
+# hyphen-delimited component that begins with a digit.
+_PF_RE = re.compile(r'^(?P<pn>.+?)-(?P<pvr>\d[^-]*(?:-r\d+)?)$')
+
+def _iter_pkg_db(root: str = _PKG_DB_DIR):
+    """
+    Yields (name, version) by scanning Portage's installed-package DB
+    directly: one directory per installed package under
+    /var/db/pkg/<category>/<pf>/. No fork, no portage-utils dependency.
+    """
+    with os.scandir(root) as cats:
+        for cat in cats:
+            if not cat.is_dir():
+                continue
+            with os.scandir(cat.path) as pfs:
+                for pf in pfs:
+                    if not pf.is_dir():
+                        continue
+                    match = _PF_RE.match(pf.name)
+                    if match:
+                        yield match.group("pn"), match.group("pvr")
+
+def _pkg_db_mtime(root: str = _PKG_DB_DIR):
+    """
+    Staleness key for /var/db/pkg: the max mtime (ns) over the root and its
+    category directories. A merge or unmerge touches its category dir, which
+    the root's own mtime alone would miss. Returns None if unreadable.
+    """
+    try:
+        latest = os.stat(root).st_mtime_ns
+        with os.scandir(root) as cats:
+            for cat in cats:
+                if cat.is_dir():
+                    latest = max(latest, cat.stat().st_mtime_ns)
+        return latest
+    except OSError:
+        return None
+
 def run_cmd(cmd: list) -> bool:
     """Helper to run an interactive command."""
     try:
@@ -26,14 +66,15 @@ class Provider(BaseProvider):
     """Gentoo provider implementation."""
 
     def __init__(self):
-        if not shutil.which("eselect"):
+        super().__init__()
+        if not _which("eselect"):
             print(f"{YELLOW}Warning: 'eselect' not found. Overlays will not work.{NC}")
             print("Please install 'app-eselect/eselect-repository'.")
             self.can_add_overlay = False
         else:
             self.can_add_overlay = True
         
-        if not shutil.which("qlist"):
+        if not _which("qlist"):
             print(f"{RED}Error: 'qlist' not found. This provider cannot function.{NC}")
             print("Please install 'app-portage/portage-utils'.")
             self.can_list = False
@@ -51,10 +92,13 @@ class Provider(BaseProvider):
             if not run_cmd(["sudo", "emerge", "--noreplace", "--verbose", f"={pkg_name}" if "==" in pkg_name else pkg_name]):
                 print(f"{YELLOW}Warning: Failed to install {pkg_name}{NC}")
                 all_ok = False
+        self._invalidate_installed_cache()
         return all_ok
 
     def remove(self, packages: list) -> bool:
-        return run_cmd(["sudo", "emerge", "-C", "--verbose"] + packages)
+        all_ok = run_cmd(["sudo", "emerge", "-C", "--verbose"] + packages)
+        self._invalidate_installed_cache()
+        return all_ok
 
     def update(self, ignore_list: list) -> bool:
         # This is complex. We'd have to add to /etc/portage/package.mask
@@ -65,19 +109,34 @@ class Provider(BaseProvider):
                 print(f"  >={pkg}")
         
         run_cmd(["sudo", "emerge", "--sync"])
-        return run_cmd(["sudo", "emerge", "-auDN", "@world"])
+        all_ok = run_cmd(["sudo", "emerge", "-auDN", "@world"])
+        self._invalidate_installed_cache()
+        return all_ok
 
     def search(self, package: str) -> bool:
         return run_cmd(["emerge", "-s", package])
 
-    def get_installed_packages(self) -> set:
+    def get_installed_packages(self, refresh: bool = False) -> set:
+        if self._installed_cache is not None and not refresh:
+            return self._installed_cache
+        try:
+            packages = {name for name, _ in _iter_pkg_db()}
+            self._installed_cache = packages
+            return packages
+        except OSError:
+            pass
+        # Fallback: qlist, if /var/db/pkg is unreadable.
         if not self.can_list: return set()
         try:
-            result = run_cmd_capture(["qlist", "-I"])
+            # Stream line-by-line instead of buffering the full qlist output.
             packages = set()
-            for line in result.stdout.strip().split('\n'):
-                if '/' in line:
-                    packages.add(line.split('/')[-1])
+            with subprocess.Popen(["qlist", "-I"], stdout=subprocess.PIPE,
+                                  text=True, errors='ignore', bufsize=1 << 20) as proc:
+                for line in proc.stdout:
+                    line = line.rstrip('\n')
+                    if '/' in line:
+                        packages.add(line.split('/')[-1])
+            self._installed_cache = packages
             return packages
         except (subprocess.CalledProcessError, FileNotFoundError):
             return set()
@@ -95,13 +154,34 @@ class Provider(BaseProvider):
         except (subprocess.CalledProcessError, FileNotFoundError, IndexError):
             return ""
 
-    def get_installed_packages_with_versions(self) -> dict:
+    def get_installed_packages_with_versions(self, refresh: bool = False) -> dict:
+        if self._installed_versions_cache is not None and not refresh:
+            return self._installed_versions_cache
+        mtime = _pkg_db_mtime()
+        if mtime is not None and not refresh:
+            cached = _disk_cache_load("installed-portage", mtime)
+            if cached is not None:
+                self._installed_versions_cache = cached
+                return cached
+        try:
+            pkg_map = dict(_iter_pkg_db())
+            self._installed_versions_cache = pkg_map
+            if mtime is not None:
+                _disk_cache_store("installed-portage", mtime, pkg_map)
+            return pkg_map
+        except OSError:
+            pass
+        # Fallback: qlist, if /var/db/pkg is unreadable.
         if not self.can_list: return {}
         pkg_map = {}
         try:
-            result = run_cmd_capture(["qlist", "-I"])
-            for line in result.stdout.strip().split('\n'):
-                if '/' in line:
+            # Stream line-by-line instead of buffering the full qlist output.
+            with subprocess.Popen(["qlist", "-I"], stdout=subprocess.PIPE,
+                                  text=True, errors='ignore', bufsize=1 << 20) as proc:
+                for line in proc.stdout:
+                    line = line.rstrip('\n')
+                    if '/' not in line:
+                        continue
                     try:
                         full_name = line.split(' ')[0]
                         name = full_name.split('/')[-1]
@@ -110,6 +190,7 @@ class Provider(BaseProvider):
                         pkg_map[name_no_ver] = version
                     except ValueError:
                         pass
+            self._installed_versions_cache = pkg_map
             return pkg_map
         except (subprocess.CalledProcessError, FileNotFoundError):
             return pkg_map
@@ -1,8 +1,9 @@
 # providers/opensuse.py
+import os
 import subprocess
 import hashlib
 import re
-from .base_provider import BaseProvider
+from .base_provider import BaseProvider, _disk_cache_load, _disk_cache_store
 
 YELLOW = '\033[1;33m'
 RED = '\033[0;31m'
@@ -22,6 +23,16 @@ def run_cmd_capture(cmd: list) -> subprocess.CompletedProcess:
     """Helper to run a non-interactive command and capture output."""
     return subprocess.run(cmd, check=True, text=True, capture_output=True, errors='ignore')
 
+def _rpm_db_mtime():
+    """mtime (ns) of the rpm database file, or None if it cannot be found."""
+    # rpm >= 4.16 uses the sqlite backend; older installs use BDB 'Packages'.
+    for path in ("/var/lib/rpm/rpmdb.sqlite", "/var/lib/rpm/Packages"):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+    return None
+
 class Provider(BaseProvider):
     """openSUSE provider implementation."""
 
@@ -34,10 +45,13 @@ class Provider(BaseProvider):
             if not run_cmd(["sudo", "zypper", "install", "--non-interactive", "--no-recommends", pkg]):
                 print(f"{YELLOW}Warning: Failed to install {pkg}{NC}")
                 all_ok = False
+        self._invalidate_installed_cache()
         return all_ok
 
     def remove(self, packages: list) -> bool:
-        return run_cmd(["sudo", "zypper", "remove", "--non-interactive"] + packages)
+        all_ok = run_cmd(["sudo", "zypper", "remove", "--non-interactive"] + packages)
+        self._invalidate_installed_cache()
+        return all_ok
 
     def update(self, ignore_list: list) -> bool:
         cmd = ["sudo", "zypper", "dup", "--non-interactive", "--no-recommends"]
@@ -52,55 +66,65 @@ class Provider(BaseProvider):
         if ignore_list:
             print(f"{YELLOW}Removing locks...{NC}")
             run_cmd(["sudo", "zypper", "removelock"] + ignore_list)
-            
+
+        self._invalidate_installed_cache()
         return all_ok
 
     def search(self, package: str) -> bool:
         return run_cmd(["zypper", "search", package])
 
-    def get_installed_packages(self) -> set:
-        try:
-            result = run_cmd_capture(["rpm", "-qa", "--qf", "%{NAME}\n"])
-            return set(result.stdout.strip().split('\n'))
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return set()
+    def get_installed_packages(self, refresh: bool = False) -> set:
+        if self._installed_cache is not None and not refresh:
+            return self._installed_cache
+        # Derive the name set from the name+version query so both methods
+        # share a single rpm -qa invocation (and its cache).
+        self._installed_cache = set(self.get_installed_packages_with_versions(refresh=refresh))
+        return self._installed_cache
 
     # --- NEW: Version Pinning Methods ---
     
     def get_package_version(self, package: str) -> str:
         try:
-            # rpm -q <pkg> --qf '%{VERSION}-%{RELEASE}'
-            result = run_cmd_capture(["rpm", "-q", package, "--qf", "%{VERSION}-%{RELEASE}"])
+            # %{EVR} covers epoch:version-release in one field
+            result = run_cmd_capture(["rpm", "-q", package, "--qf", "%{EVR}"])
             return result.stdout.strip()
         except (subprocess.CalledProcessError, FileNotFoundError):
             return ""
 
-    def get_installed_packages_with_versions(self) -> dict:
+    def get_installed_packages_with_versions(self, refresh: bool = False) -> dict:
+        if self._installed_versions_cache is not None and not refresh:
+            return self._installed_versions_cache
+        # Disk cache: reuse a previous run's rpm -qa parse while the rpm
+        # database file is unchanged.
+        mtime = _rpm_db_mtime()
+        if mtime is not None and not refresh:
+            cached = _disk_cache_load("installed-rpm", mtime)
+            if cached is not None:
+                self._installed_versions_cache = cached
+                return cached
         pkg_map = {}
         try:
-            # rpm -qa --qf '%{NAME}\t%{VERSION}-%{RELEASE}\n'
-            result = run_cmd_capture(["rpm", "-qa", "--qf", "%{NAME}\t%{VERSION}-%{RELEASE}\n"])
-            for line in result.stdout.strip().split('\n'):
-                if line and '\t' in line:
-                    try:
-                        name, version = line.split('\t')
+            # Stream line-by-line instead of buffering the full rpm -qa
+            # output into one string and splitting it. %{EVR} covers
+            # epoch:version-release in one field.
+            with subprocess.Popen(["rpm", "-qa", "--qf", "%{NAME}\t%{EVR}\n"],
+                                  stdout=subprocess.PIPE, text=True, errors='ignore',
+                                  bufsize=1 << 20) as proc:
+                for line in proc.stdout:
+                    name, sep, version = line.rstrip('\n').partition('\t')
+                    if sep:
                         pkg_map[name] = version
-                    except ValueError:
-                        pass
+            self._installed_versions_cache = pkg_map
+            if mtime is not None:
+                _disk_cache_store("installed-rpm", mtime, pkg_map)
             return pkg_map
         except (subprocess.CalledProcessError, FileNotFoundError):
             return pkg_map
             
     def compare_versions(self, v1: str, v2: str) -> int:
         try:
-            # rpmdev-vercmp is in rpm-devel or similar, not always present.
-            # Use 'rpm --eval' as a built-in alternative.
-            # This is complex, so we'll do a simpler string sort for now.
-            # A more robust solution would use the `packaging` python library
-            # For this exercise, we'll simulate it.
-            if v1 > v2: return 1
-            if v1 < v2: return 2
-            return 0
+            # Pure-Python rpmvercmp from BaseProvider; no subprocess needed.
+            return self._rpm_compare(v1, v2)
         except Exception:
             return 0 # Failsafe
             
@@ -110,7 +134,9 @@ class Provider(BaseProvider):
         # zypper install <pkg-version>
         if not run_cmd(["sudo", "zypper", "install", "--non-interactive", "--no-recommends", f"{package}-{version}"]):
             print(f"  {YELLOW}Could not install {package}-{version}. It may not be available in your repos.{NC}")
+            self._invalidate_installed_cache()
             return False
+        self._invalidate_installed_cache()
         return True
 
     def show_package_versions(self, package: str):
@@ -175,4 +201,5 @@ class Provider(BaseProvider):
         if all_packages:
             if not run_cmd(["sudo", "zypper", "install", "--non-interactive", "--no-recommends", "--allow-vendor-change"] + all_packages):
                 all_ok = False
+            self._invalidate_installed_cache()
         return all_ok
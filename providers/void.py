@@ -1,20 +1,58 @@
 # providers/void.py
+import os
 import subprocess
-import shutil
-import re
+import sys
+import types
 from pathlib import Path
-from .base_provider import BaseProvider
+from .base_provider import BaseProvider, _which
 
-YELLOW = '\033[1;33m'
-NC = '\033[0m'
-RED = '\033[0;31m'
-BLUE = '\033[0;34m'
-GREEN = '\033[0;32m'
+# Decide color support once at import: when stdout is redirected (CI,
+# logs) or the terminal is dumb, the constants collapse to empty strings
+# so the f-strings neither allocate nor emit escape sequences.
+if sys.stdout.isatty() and os.environ.get("TERM") != "dumb":
+    YELLOW = '\033[1;33m'
+    NC = '\033[0m'
+    RED = '\033[0;31m'
+    BLUE = '\033[0;34m'
+    GREEN = '\033[0;32m'
+else:
+    YELLOW = NC = RED = BLUE = GREEN = ''
 
-def run_cmd(cmd: list, cwd: Path = None) -> bool:
+# Computed once at import for the git subprocesses: never stall on a
+# credential prompt — in a CLI sync a hung fetch is worse than a failed one.
+_GIT_ENV = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+
+# Static provider metadata, built once at import instead of fresh dicts per
+# call. _DEPS is a read-only view; _BASE_PACKAGES stays a plain dict with
+# lists because 'init' feeds it straight to yaml.dump().
+_DEPS = types.MappingProxyType({
+    "yq": "sudo xbps-install -y yq",
+    "timeshift": "sudo xbps-install -y timeshift",
+    "snapper": "sudo xbps-install -y snapper",
+    "flatpak": "sudo xbps-install -y flatpak",
+    "xtools": "sudo xbps-install -y xtools"
+})
+
+_BASE_PACKAGES = {
+    "description": "Base packages for all Void machines",
+    "packages": [
+        "NetworkManager",
+        "vim",
+        "git",
+        "yq",
+        "xtools",
+        "timeshift",
+        "flatpak"
+    ],
+    "void_src": [
+        "heroic"
+    ]
+}
+
+def run_cmd(cmd: list, cwd: Path = None, env: dict = None) -> bool:
     """Helper to run an interactive command."""
     try:
-        subprocess.run(cmd, check=True, cwd=cwd)
+        subprocess.run(cmd, check=True, cwd=cwd, env=env)
         return True
     except (subprocess.CalledProcessError, FileNotFoundError):
         return False
@@ -23,12 +61,33 @@ def run_cmd_capture(cmd: list) -> subprocess.CompletedProcess:
     """Helper to run a non-interactive command and capture output."""
     return subprocess.run(cmd, check=True, text=True, capture_output=True, errors='ignore')
 
+def run_cmd_stream(cmd: list):
+    """
+    Yields stdout lines one at a time instead of buffering the whole
+    output into a string and splitting it: constant memory, one pass.
+    Raises CalledProcessError on nonzero exit once the stream ends.
+    """
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True,
+                          errors='ignore', bufsize=1 << 20) as proc:
+        try:
+            for line in proc.stdout:
+                yield line.rstrip('\n')
+        except GeneratorExit:
+            # The consumer stopped early (e.g. found its first match);
+            # terminate the child rather than draining the rest of its
+            # output or blocking on a full pipe.
+            proc.terminate()
+            raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
 class Provider(BaseProvider):
     """Void Linux provider implementation."""
     
     def __init__(self):
+        super().__init__()
         self.src_repo_path = Path.home() / "void-packages"
-        if not shutil.which("xbps-src"):
+        if not _which("xbps-src"):
              print(f"{YELLOW}Warning: 'xbps-src' not found. 'void_src' packages will not work.{NC}")
              print("Please install 'xtools' and clone the void-packages git repo.")
              self.can_build_src = False
@@ -36,72 +95,135 @@ class Provider(BaseProvider):
              self.can_build_src = True
 
     def install(self, packages: list) -> bool:
-        """Installs packages one-by-one to show progress."""
+        """Installs all packages in one xbps call, falling back to one-by-one on failure."""
+        if not packages:
+            return True
+        # xbps-install can take version strings like 'package>=1.0'.
+        # The common case has no '=' at all, so skip the replace chain
+        # (and its intermediate allocations) unless one is present.
+        sanitized = [pkg.replace("==", "-").replace("=", "") if "=" in pkg else pkg
+                     for pkg in packages]
+        print(f"\n--- Installing {len(sanitized)} packages ---")
+        # Dry-run the resolver first: a solver pass that touches nothing,
+        # but yields the planned actions so per-package progress can be
+        # shown without giving up the single batched transaction below.
+        try:
+            plan = [line.split(' ', 1)[0]
+                    for line in run_cmd_capture(["xbps-install", "-yn"] + sanitized).stdout.splitlines()
+                    if line]
+            for i, pkgver in enumerate(plan):
+                print(f"  ({i+1}/{len(plan)}) {pkgver}")
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            pass
+        if run_cmd(["sudo", "xbps-install", "-y"] + sanitized):
+            self._invalidate_installed_cache()
+            return True
+        if len(sanitized) == 1:
+            print(f"{YELLOW}Warning: Failed to install {sanitized[0]}{NC}")
+            self._invalidate_installed_cache()
+            return False
+        # The batch failed. Retry one-by-one to identify the culprit
+        # and still install everything else.
+        print(f"{YELLOW}Batch install failed. Retrying packages one-by-one...{NC}")
         all_ok = True
-        total = len(packages)
-        for i, pkg in enumerate(packages):
-            # xbps-install can take version strings like 'package>=1.0'
-            pkg_name = pkg.replace("==", "-").replace("=", "")
+        total = len(sanitized)
+        for i, pkg_name in enumerate(sanitized):
             print(f"\n--- Installing {pkg_name} ({i+1}/{total}) ---")
             if not run_cmd(["sudo", "xbps-install", "-y", pkg_name]):
                 print(f"{YELLOW}Warning: Failed to install {pkg_name}{NC}")
                 all_ok = False
+        self._invalidate_installed_cache()
         return all_ok
 
     def remove(self, packages: list) -> bool:
-        return run_cmd(["sudo", "xbps-remove", "-y"] + packages)
+        all_ok = run_cmd(["sudo", "xbps-remove", "-y"] + packages)
+        self._invalidate_installed_cache()
+        return all_ok
 
     def update(self, ignore_list: list) -> bool:
         cmd = ["sudo", "xbps-install", "-Syu"]
         if ignore_list:
-            print(f"{YELLOW}Ignoring {len(ignore_list)} packages: {', '.join(ignore_list)}{NC}")
-            for pkg in ignore_list:
-                cmd.append(f"--exclude={pkg}")
-        return run_cmd(cmd)
+            # Only build the joined package listing for an interactive
+            # terminal; when piped, the multi-KB string is wasted work.
+            if sys.stdout.isatty():
+                print(f"{YELLOW}Ignoring {len(ignore_list)} packages: {', '.join(ignore_list)}{NC}")
+            cmd.extend(f"--exclude={pkg}" for pkg in ignore_list)
+        all_ok = run_cmd(cmd)
+        self._invalidate_installed_cache()
+        return all_ok
 
     def search(self, package: str) -> bool:
         return run_cmd(["xbps-query", "-Rs", package])
 
-    def get_installed_packages(self) -> set:
-        try:
-            result = run_cmd_capture(["xbps-query", "-l"])
-            packages = set()
-            for line in result.stdout.strip().split('\n'):
-                if line:
-                    pkg_full = line.split(' ')[1]
-                    pkg_name = pkg_full.rsplit('-', 2)[0]
-                    packages.add(pkg_name)
-            return packages
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return set()
+    def get_installed_packages(self, refresh: bool = False) -> set:
+        if self._installed_cache is not None and not refresh:
+            return self._installed_cache
+        # Derive the name set from the name+version query so both methods
+        # share a single xbps-query invocation (and its cache). frozenset
+        # so callers can safely memoize the instance without copying.
+        self._installed_cache = frozenset(self.get_installed_packages_with_versions(refresh=refresh))
+        return self._installed_cache
 
     # --- NEW: Version Pinning Methods ---
     
     def get_package_version(self, package: str) -> str:
-        try:
-            result = run_cmd_capture(["xbps-query", "-p", "version", package])
-            return result.stdout.strip().split('-')[0] # 'version_rev' -> 'version'
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return ""
+        # Dict lookup against the memoized name->version map; avoids one
+        # xbps-query fork per package in pin-verification loops. Callers
+        # needing many versions should use the bulk get_package_versions().
+        return self.get_installed_packages_with_versions().get(package, "")
+
+    def _iter_installed(self):
+        """
+        Yields (name, version_rev) straight from xbps-query -l. The single
+        parser both public query methods share: offset-based slicing, no
+        intermediate lists. The format is stable: 'ii <pkgver> <description>'
+        with a two-char state column, and the last '-' in pkgver separates
+        name from version_rev (xbps versions never contain '-'), so
+        hyphenated names parse correctly too.
+        """
+        for line in run_cmd_stream(["xbps-query", "-l"]):
+            end = line.find(' ', 3)
+            if end == -1:
+                end = len(line)
+            pkgver = line[3:end]
+            dash = pkgver.rfind('-')
+            if dash > 0:
+                yield pkgver[:dash], pkgver[dash + 1:]
 
-    def get_installed_packages_with_versions(self) -> dict:
+    def get_installed_packages_with_versions(self, refresh: bool = False) -> dict:
+        if self._installed_versions_cache is not None and not refresh:
+            return self._installed_versions_cache
         pkg_map = {}
         try:
-            result = run_cmd_capture(["xbps-query", "-l"])
-            for line in result.stdout.strip().split('\n'):
-                if line:
-                    try:
-                        pkg_full = line.split(' ')[1]
-                        pkg_name = pkg_full.rsplit('-', 2)[0]
-                        version = pkg_full.rsplit('-', 2)[1]
-                        pkg_map[pkg_name] = version
-                    except (ValueError, IndexError):
-                        pass
-            return pkg_map
+            pkg_map = dict(self._iter_installed())
+            # Read-only view: callers only do lookups and iteration, and
+            # an immutable return lets them reuse it without copying.
+            self._installed_versions_cache = types.MappingProxyType(pkg_map)
+            return self._installed_versions_cache
         except (subprocess.CalledProcessError, FileNotFoundError):
             return pkg_map
             
     def compare_versions(self, v1: str, v2: str) -> int:
+        # Forking xbps-uhelper once per comparison is O(N) subprocess
+        # spawns during pin reconciliation. xbps versions ('1.2.3_1')
+        # follow the same digit/alpha segment rules as the shared
+        # rpm-style comparator, so compare in Python by default; the
+        # subprocess path is kept behind FCLI_STRICT_XBPS.
+        if os.environ.get("FCLI_STRICT_XBPS"):
+            return self._compare_versions_xbps(v1, v2)
+        try:
+            return self._rpm_compare(v1, v2)
+        except Exception:
+            return 0 # Failsafe
+
+    def _compare_versions_xbps(self, v1: str, v2: str) -> int:
+        """Original xbps-uhelper subprocess path, kept behind FCLI_STRICT_XBPS."""
+        # Short-circuit on the memoized $PATH probe rather than paying a
+        # failed process launch per comparison when the tool is absent.
+        if not _which("xbps-uhelper"):
+            if v1 > v2: return 1
+            if v1 < v2: return 2
+            return 0
         try:
             # xbps-uhelper version-cmp v1 v2
             proc = subprocess.run(["xbps-uhelper", "version-cmp", v1, v2], capture_output=True, text=True)
@@ -122,12 +244,15 @@ class Provider(BaseProvider):
         return False
 
     def show_package_versions(self, package: str):
-        # 2. Repo version
+        # 2. Repo version. -Rs substring-scans every repo index entry for
+        # one answer; the exact property probe asks for just this package.
         try:
-            result = run_cmd_capture(["xbps-query", "-Rs", package])
-            repo_ver = re.search(r"version:\s*(.*)", result.stdout).group(1)
-            print(f"  {BLUE}Available:{NC} {repo_ver.strip()}")
-        except (subprocess.CalledProcessError, AttributeError):
+            result = run_cmd_capture(["xbps-query", "-R", "-p", "version", package])
+            repo_ver = result.stdout.strip()
+            if not repo_ver:
+                raise ValueError
+            print(f"  {BLUE}Available:{NC} {repo_ver}")
+        except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
             print(f"  {YELLOW}Not found in repositories{NC}")
         # 3. Cached versions
         print(f"  {BLUE}In Cache:{NC} (check /var/cache/xbps)")
@@ -135,30 +260,10 @@ class Provider(BaseProvider):
     # --- End of Versioning Methods ---
 
     def get_deps(self) -> dict:
-        return {
-            "yq": "sudo xbps-install -y yq",
-            "timeshift": "sudo xbps-install -y timeshift",
-            "snapper": "sudo xbps-install -y snapper",
-            "flatpak": "sudo xbps-install -y flatpak",
-            "xtools": "sudo xbps-install -y xtools"
-        }
+        return _DEPS
 
     def get_base_packages(self) -> dict:
-        return {
-            "description": "Base packages for all Void machines",
-            "packages": [
-                "NetworkManager",
-                "vim",
-                "git",
-                "yq",
-                "xtools",
-                "timeshift",
-                "flatpak"
-            ],
-            "void_src": [
-                "heroic"
-            ]
-        }
+        return _BASE_PACKAGES
 
     def install_src(self, packages: list) -> bool:
         if not self.can_build_src:
@@ -168,29 +273,59 @@ class Provider(BaseProvider):
         if not self.src_repo_path.exists():
             print(f"Void packages repo not found at {self.src_repo_path}")
             print("Cloning 'void-packages' from GitHub...")
-            if not run_cmd(["git", "clone", "https://github.com/void-linux/void-packages.git", str(self.src_repo_path)]):
+            # Shallow, blobless clone: the build only needs the current
+            # tree, not hundreds of MB of history. pack.threads=0 lets git
+            # resolve deltas on all cores.
+            if not run_cmd(["git", "-c", "pack.threads=0", "clone", "--depth=1", "--filter=blob:none",
+                            "https://github.com/void-linux/void-packages.git", str(self.src_repo_path)],
+                           env=_GIT_ENV):
                 print("Error: Failed to clone void-packages repo.")
                 return False
-        
+
         print("Updating void-packages repo...")
-        if not run_cmd(["git", "pull", "origin", "master"], cwd=self.src_repo_path):
-            print("Warning: 'git pull' failed, proceeding anyway...")
+        # Shallow fetch + hard reset keeps the checkout at upstream master
+        # without ever downloading or merging old history.
+        if not (run_cmd(["git", "-C", str(self.src_repo_path), "-c", "pack.threads=0",
+                         "fetch", "--depth=1", "origin", "master"], env=_GIT_ENV)
+                and run_cmd(["git", "-C", str(self.src_repo_path), "reset", "--hard", "FETCH_HEAD"],
+                            env=_GIT_ENV)):
+            print("Warning: updating void-packages failed, proceeding anyway...")
         
         if not run_cmd(["./xbps-src", "bootstrap-update"], cwd=self.src_repo_path):
             print("Error: './xbps-src bootstrap-update' failed.")
             return False
             
         all_ok = True
+        # Builds stay serial: every ./xbps-src invocation shares the one
+        # masterdir/builddir under the checkout, and xbps-src only supports
+        # concurrent builds with distinct masterdirs. Parallelism within a
+        # build comes from xbps-src's own make jobs.
         for pkg in packages:
             print(f"Building {pkg} from source...")
             if not run_cmd(["./xbps-src", "pkg", pkg], cwd=self.src_repo_path):
                 print(f"Warning: Failed to build {pkg}")
                 all_ok = False
         
-        print("Installing built packages...")
         repo_path = self.src_repo_path / "host/binpkgs"
-        if not run_cmd(["sudo", "xbps-install", f"--repository={repo_path}", "-y"] + packages):
+        # Only install packages whose freshly built version differs from
+        # what is already on the system; re-resolving an up-to-date set
+        # still re-reads every repo index and touches the package DB.
+        installed = self.get_installed_packages_with_versions()
+        built = {}
+        for pkg_file in repo_path.glob("*.xbps"):
+            # '<name>-<version>_<rev>.<arch>.xbps'
+            pkgver = pkg_file.name[:-5].rsplit('.', 1)[0]
+            name, sep, version = pkgver.rpartition('-')
+            if sep:
+                built[name] = version
+        to_install = [pkg for pkg in packages
+                      if pkg not in built or installed.get(pkg) != built[pkg]]
+        if not to_install:
+            print("All built packages are already installed at the built version.")
+            return all_ok
+        print("Installing built packages...")
+        if not run_cmd(["sudo", "xbps-install", f"--repository={repo_path}", "-y"] + to_install):
              print("Warning: Some packages may not have installed.")
              all_ok = False
-             
+        self._invalidate_installed_cache()
         return all_ok